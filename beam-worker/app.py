@@ -1,28 +1,42 @@
 # beam_worker.py
 """
 Production-ready Beam worker for background removal.
-Handles both static images (PNG, JPG, WEBP) and animated GIFs.
+Handles static images (PNG, JPG, WEBP), animated GIFs and short videos (MP4, WebM).
 """
 from beam import endpoint, Image, env, Volume
 import base64
 import io
-from typing import Dict, Any, Optional, Tuple, List
+from typing import Dict, Any, Optional, Tuple, List, Iterable, Iterator
+import os
 import time
 import gc
+import itertools
+import math
 
-# Only import heavy dependencies in remote environment
-if env.is_remote():
-    import os
+# Only import heavy dependencies in remote environment (or for local runs such as benchmark.py)
+if env.is_remote() or os.environ.get("BG_WORKER_LOCAL") == "1":
     import torch
-    from PIL import Image as PILImage, ImageFilter, ImageSequence
+    from PIL import Image as PILImage, ImageFilter, ImageSequence, ImageOps, ImageColor
     import numpy as np
     from transformers import AutoModelForImageSegmentation
     from scipy import ndimage
     from torchvision import transforms
+    import av
+    from gif_encoder import encode_gif
+
+# Inference resolution and numeric precision used by the endpoints
+MODEL_RESOLUTION = 1024
+MODEL_PRECISION = "fp32"
+PRECISIONS = {
+    "fp32": {"dtype": "float32", "matmul_precision": "highest"},
+    "tf32": {"dtype": "float32", "matmul_precision": "high"},
+    "fp16": {"dtype": "float16", "matmul_precision": "highest"},
+}
+
 
-def load_model():
+def load_model(resolution: int = MODEL_RESOLUTION, precision: str = MODEL_PRECISION):
     """Initialize model once when container starts"""
-    print("🚀 Loading BRIA RMBG-2.0 model...")
+    print(f"🚀 Loading BRIA RMBG-2.0 model ({resolution}px, {precision})...")
 
     # Use cache directory for model persistence
     cache_dir = "./model_cache"
@@ -37,13 +51,13 @@ def load_model():
 
     # Setup device
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    torch.set_float32_matmul_precision('highest')
-    model.to(device)
+    torch.set_float32_matmul_precision(PRECISIONS[precision]["matmul_precision"])
+    model.to(device, dtype=getattr(torch, PRECISIONS[precision]["dtype"]))
     model.eval()
 
     # Preprocessing pipeline
     transform = transforms.Compose([
-        transforms.Resize((1024, 1024), antialias=True),
+        transforms.Resize((resolution, resolution), antialias=True),
         transforms.ToTensor(),
         transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
     ])
@@ -65,54 +79,294 @@ QUALITY_PRESETS = {
 MAX_GIF_FRAMES = 500  # Prevent memory issues
 MAX_GIF_PIXELS = 10_000_000  # 10 megapixels per frame
 
+# Rough cost model used for admission control (measured on RTX4090)
+COST_MODEL = {
+    "base_ms": 150,  # decode, transfer and response overhead
+    "inference_ms_per_mp": 60,  # model + mask post-processing
+    "encode_ms_per_mp": 25,  # alpha compositing + encode
+    "animated_frame_ms": 40,  # frame extraction and GIF quantization
+}
 
-@endpoint(
-    name="bg-removal",
-    cpu=2,  # Increased for GIF processing
-    memory="8Gi",  # Increased for large GIFs
-    gpu="RTX4090",
-    image=Image(python_version="python3.12")
-    .add_python_packages([
-        "torch==2.7.1",
-        "torchvision==0.22.1",
-        "transformers==4.52.4",
-        "scipy==1.15.3",
-        "pillow==11.2.1",
-        "numpy==2.3.0",
-        "timm==1.0.15",
-        "kornia==0.8.1"
-    ]),
-    volumes=[Volume(name="model_cache", mount_path="./model_cache")],
-    on_start=load_model,
-    secrets=["HUGGING_FACE_HUB_TOKEN"],
-    keep_warm_seconds=300,  # Keep warm for 5 minutes
-    max_pending_tasks=100,
-    timeout=180,  # Increased timeout for GIFs
-)
-def remove_background(context, **inputs) -> Dict[str, Any]:
+# Lanes keep long animated jobs from queueing in front of interactive requests.
+# Both keep the full timeout: without a bulk lane (no 'bulk_lane' input) the
+# interactive endpoint still serves expensive jobs itself.
+INTERACTIVE_TIMEOUT = 180
+BULK_TIMEOUT = 180
+LANES = {
+    "interactive": {"timeout": INTERACTIVE_TIMEOUT, "max_estimated_ms": 15_000},
+    "bulk": {"timeout": BULK_TIMEOUT, "max_estimated_ms": BULK_TIMEOUT * 1000},
+}
+
+# Animated output formats (selected with the 'animated_format' input)
+ANIMATED_FORMATS = ("gif", "webp", "apng")
+
+# Output modes (selected with the 'output_mode' input); mask modes skip the RGBA encode
+OUTPUT_MODES = ("image", "mask", "mask_bitonal", "mask_rle")
+MASK_BINARY_THRESHOLD = 128  # Alpha cutoff for bitonal/RLE masks
+CROP_ALPHA_THRESHOLD = 8  # Alpha below this is treated as empty when cropping to content
+
+# Compositing (selected with the 'background' and 'shadow' inputs)
+BACKGROUND_TYPES = ("color", "blur", "image")
+BACKGROUND_BLUR_RADIUS = 20
+BACKGROUND_BLUR_SCALE = 4  # Blur at 1/4 resolution, then upscale
+SHADOW_DEFAULTS = {"offset": [10, 10], "blur": 12, "opacity": 0.5, "color": "#000000"}
+
+# ISO BMFF brands that are still images rather than video
+IMAGE_BRANDS = (b"avif", b"avis", b"heic", b"heix", b"mif1", b"msf1")
+
+
+def _estimate_cost(size: Tuple[int, int], n_frames: int, is_animated: bool) -> int:
+    """Estimate processing time in ms from header info only, before any frame is decoded"""
+    megapixels = size[0] * size[1] / 1_000_000
+
+    # Inference runs on at most 4MP (see _process_single_frame), encoding on the full frame
+    per_frame_ms = (min(megapixels, 4.0) * COST_MODEL["inference_ms_per_mp"]
+                    + megapixels * COST_MODEL["encode_ms_per_mp"])
+    if is_animated:
+        per_frame_ms += COST_MODEL["animated_frame_ms"]
+
+    return int(COST_MODEL["base_ms"] + n_frames * per_frame_ms)
+
+
+def _content_bbox(masks: List["PILImage.Image"], padding: int,
+                  shadow: Optional[Dict[str, Any]] = None) -> Optional[Tuple[int, int, int, int]]:
     """
-    Remove background from image or animated GIF.
+    Union bounding box of visible alpha across masks (L), expanded by padding and clamped to the frame.
 
-    Expected inputs:
-    - image: base64 encoded image data
-    - quality: preset name (default: 'auto')
-    - format: output format (default: 'png')
-    - return_mask: whether to return the mask (default: False)
-    - resize: optional resize parameters
+    With a shadow the box also covers the offset, blurred shadow, which is composited after cropping.
+    """
+    boxes = []
+    for mask in masks:
+        visible = mask.point(lambda v: 255 if v >= CROP_ALPHA_THRESHOLD else 0)
+        box = visible.getbbox()
+        if box:
+            boxes.append(box)
+    if not boxes:
+        return None
+
+    left, top = min(box[0] for box in boxes), min(box[1] for box in boxes)
+    right, bottom = max(box[2] for box in boxes), max(box[3] for box in boxes)
+    if shadow:
+        (dx, dy), spread = shadow["offset"], math.ceil(3 * shadow["blur"])  # Gaussian tail is negligible past 3 sigma
+        left, right = min(left, left + dx - spread), max(right, right + dx + spread)
+        top, bottom = min(top, top + dy - spread), max(bottom, bottom + dy + spread)
+
+    width, height = masks[0].size
+    return (
+        max(0, left - padding),
+        max(0, top - padding),
+        min(width, right + padding),
+        min(height, bottom + padding),
+    )
 
-    Returns:
-    - success: boolean
-    - image: base64 encoded result
-    - mask: base64 encoded mask (if requested)
-    - error: error message (if failed)
-    - metadata: processing metadata
+
+def _encode_mask_rle(mask: "PILImage.Image") -> Dict[str, Any]:
+    """Run-length encode a binarized mask in row-major order, counts start with a background run"""
+    flat = (np.asarray(mask) >= MASK_BINARY_THRESHOLD).ravel()
+    changes = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    counts = np.diff(np.concatenate(([0], changes, [flat.size])))
+    if flat.size and flat[0]:
+        counts = np.concatenate(([0], counts))
+
+    return {
+        "size": [mask.size[1], mask.size[0]],
+        "order": "row-major",
+        "counts": counts.tolist(),
+    }
+
+
+def _is_number(value: Any) -> bool:
+    """True for JSON numbers (bools are ints in Python but not numbers here)"""
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _parse_color(color: Any) -> Tuple[int, int, int]:
+    """Parse a colour string ('#fff', 'red', ...) or [r, g, b] with integers in 0-255"""
+    if isinstance(color, str):
+        return ImageColor.getrgb(color)[:3]
+    if (isinstance(color, (list, tuple)) and len(color) == 3
+            and all(isinstance(c, int) and not isinstance(c, bool) and 0 <= c <= 255 for c in color)):
+        return tuple(color)
+    raise ValueError(f"color must be a colour string or 3 integers in 0-255, got {color!r}")
+
+
+def _parse_background(config: Any) -> Dict[str, Any]:
+    """Validate a background config; a plain string is shorthand for a solid colour"""
+    if isinstance(config, str):
+        config = {"type": "color", "color": config}
+    if not isinstance(config, dict) or config.get("type") not in BACKGROUND_TYPES:
+        raise ValueError(f"type must be one of {', '.join(BACKGROUND_TYPES)}")
+
+    background = {"type": config["type"]}
+    if config["type"] == "color":
+        background["color"] = _parse_color(config.get("color", "#ffffff"))
+    elif config["type"] == "blur":
+        radius = config.get("radius", BACKGROUND_BLUR_RADIUS)
+        if not _is_number(radius) or radius < 0:
+            raise ValueError("radius must be a non-negative number")
+        background["radius"] = float(radius)
+    else:
+        if not isinstance(config.get("image"), str) or not config["image"]:
+            raise ValueError("image background needs a base64 encoded 'image'")
+        background["image"] = PILImage.open(io.BytesIO(base64.b64decode(config["image"]))).convert("RGB")
+    return background
+
+
+def _parse_shadow(config: Any) -> Dict[str, Any]:
+    """Validate a shadow config merged over SHADOW_DEFAULTS; true uses the defaults"""
+    if config is not True and not isinstance(config, dict):
+        raise ValueError("shadow must be true or an object")
+    shadow = {**SHADOW_DEFAULTS, **(config if isinstance(config, dict) else {})}
+
+    offset = shadow["offset"]
+    if not isinstance(offset, (list, tuple)) or len(offset) != 2 or not all(_is_number(v) for v in offset):
+        raise ValueError("shadow offset must be [x, y]")
+    if not _is_number(shadow["blur"]) or shadow["blur"] < 0:
+        raise ValueError("shadow blur must be a non-negative number")
+    if not _is_number(shadow["opacity"]) or not 0 <= shadow["opacity"] <= 1:
+        raise ValueError("shadow opacity must be between 0 and 1")
+
+    return {
+        "offset": (int(offset[0]), int(offset[1])),
+        "blur": float(shadow["blur"]),
+        "opacity": float(shadow["opacity"]),
+        "color": _parse_color(shadow["color"]),
+    }
+
+
+def _render_backdrop(background: Dict[str, Any], frame: "PILImage.Image") -> "PILImage.Image":
+    """Render the RGB backdrop for one result frame"""
+    if background["type"] == "color":
+        return PILImage.new("RGB", frame.size, background["color"])
+    if background["type"] == "image":
+        return ImageOps.fit(background["image"], frame.size, PILImage.Resampling.LANCZOS)
+
+    # The RGB channels of the result are still the original pixels
+    small_size = (max(1, frame.size[0] // BACKGROUND_BLUR_SCALE), max(1, frame.size[1] // BACKGROUND_BLUR_SCALE))
+    small = frame.convert("RGB").resize(small_size, PILImage.Resampling.BILINEAR)
+    small = small.filter(ImageFilter.GaussianBlur(radius=background["radius"] / BACKGROUND_BLUR_SCALE))
+    return small.resize(frame.size, PILImage.Resampling.BILINEAR)
+
+
+def _composite(frame: "PILImage.Image", backdrop: Optional["PILImage.Image"], shadow: Optional[Dict[str, Any]]) -> "PILImage.Image":
     """
+    Alpha-blend an RGBA result over an optional drop shadow and backdrop in one vectorized pass.
+
+    Returns RGB when a backdrop is given (fully opaque), otherwise RGBA.
+    """
+    rgba = np.asarray(frame, dtype=np.float32) / 255.0
+    rgb, alpha = rgba[..., :3], rgba[..., 3:]
+
+    if backdrop is not None:
+        base = np.asarray(backdrop, dtype=np.float32) / 255.0
+        base_alpha = np.ones_like(alpha)
+    else:
+        base = np.zeros_like(rgb)
+        base_alpha = np.zeros_like(alpha)
+
+    if shadow:
+        offset = shadow["offset"]
+        shadow_mask = PILImage.new("L", frame.size, 0)
+        shadow_mask.paste(frame.getchannel("A"), offset)
+        if shadow["blur"] > 0:
+            shadow_mask = shadow_mask.filter(ImageFilter.GaussianBlur(radius=shadow["blur"]))
+        shadow_alpha = np.asarray(shadow_mask, dtype=np.float32)[..., None] / 255.0 * shadow["opacity"]
+        shadow_color = np.array(shadow["color"], dtype=np.float32) / 255.0
+
+        # Shadow "over" backdrop
+        covered = shadow_alpha + base_alpha * (1 - shadow_alpha)
+        base = (shadow_color * shadow_alpha + base * base_alpha * (1 - shadow_alpha)) / np.maximum(covered, 1e-6)
+        base_alpha = covered
+
+    # Subject "over" shadow and backdrop
+    out_alpha = alpha + base_alpha * (1 - alpha)
+    out_rgb = (rgb * alpha + base * base_alpha * (1 - alpha)) / np.maximum(out_alpha, 1e-6)
+
+    if backdrop is not None:
+        return PILImage.fromarray((out_rgb * 255 + 0.5).astype(np.uint8), mode='RGB')
+    out = np.concatenate([out_rgb, out_alpha], axis=-1)
+    return PILImage.fromarray((out * 255 + 0.5).astype(np.uint8), mode='RGBA')
+
+
+def _is_video(data: bytes) -> bool:
+    """Detect MP4/MOV (ISO BMFF 'ftyp' box) and WebM/MKV (EBML header) containers"""
+    if data[4:8] == b"ftyp":
+        return data[8:12] not in IMAGE_BRANDS
+    return data[:4] == b"\x1a\x45\xdf\xa3"
+
+
+def _probe_video(data: bytes) -> Dict[str, Any]:
+    """Read frame size, frame count (None if the headers do not say) and frame duration from the container headers"""
+    with av.open(io.BytesIO(data)) as container:
+        stream = container.streams.video[0]
+        rate = float(stream.average_rate or 25)
+        n_frames = stream.frames
+        if not n_frames and stream.duration and stream.time_base:
+            n_frames = int(stream.duration * stream.time_base * rate)
+        if not n_frames and container.duration:
+            n_frames = int(container.duration / av.time_base * rate)
+
+        return {
+            "size": (stream.codec_context.width, stream.codec_context.height),
+            "n_frames": n_frames or None,
+            "duration": max(10, int(round(1000 / rate))),
+            "format": container.format.name.split(",")[0],
+        }
+
+
+def _iter_video_frames(data: bytes, duration: int) -> Iterator[Tuple["PILImage.Image", int]]:
+    """Decode video frames one at a time, yielding (frame, duration_ms)"""
+    with av.open(io.BytesIO(data)) as container:
+        stream = container.streams.video[0]
+        stream.thread_type = "AUTO"
+        for frame in container.decode(stream):
+            yield frame.to_image(), duration
+
+
+def _encode_animation(frames: List["PILImage.Image"], durations: List[int], loop: int,
+                      output_format: str, buffer: io.BytesIO) -> None:
+    """Encode RGBA frames as GIF (1-bit alpha) or animated WebP/APNG (8-bit alpha)"""
+    if output_format == 'gif':
+        encode_gif(frames, durations, loop, buffer)
+    elif output_format == 'webp':
+        frames[0].save(
+            buffer,
+            format='WEBP',
+            save_all=True,
+            append_images=frames[1:],
+            duration=durations,
+            loop=loop,
+            quality=90,
+            method=4  # method=6 is much slower on long animations for little gain
+        )
+    else:
+        frames[0].save(
+            buffer,
+            format='PNG',
+            save_all=True,
+            append_images=frames[1:],
+            duration=durations,
+            loop=loop
+        )
+
+
+def _remove_background(context, inputs: Dict[str, Any], lane: str) -> Dict[str, Any]:
+    """Shared request handler behind the interactive and bulk endpoints"""
 
     start_time = time.time()
 
+    # Per-stage latency, reported in metadata
+    stage_ms = {"inference": 0.0, "postprocess": 0.0}
+
+    # Queue wait is measured against the client's submission timestamp (epoch seconds)
+    queue_wait_ms = None
+    if _is_number(inputs.get('submitted_at')):
+        queue_wait_ms = max(0, int((start_time - inputs['submitted_at']) * 1000))
+
     # --- Helper function for processing a single frame ---
-    def _process_single_frame(image: PILImage.Image, settings: dict, original_image_bytes: bytes = None) -> Tuple[PILImage.Image, PILImage.Image]:
-        """Process one frame, returns (final_image, mask_pil)"""
+    def _process_single_frame(image: PILImage.Image, settings: dict, original_image_bytes: bytes = None,
+                              needs_rgba: bool = True) -> Tuple[Optional[PILImage.Image], PILImage.Image]:
+        """Process one frame, returns (final_image, mask_pil); final_image is None unless needs_rgba"""
         model, transform, device = context.on_start_value
         original_frame_size = image.size
 
@@ -124,10 +378,14 @@ def remove_background(context, **inputs) -> Dict[str, Any]:
                           int(original_frame_size[1] * scale_factor))
             image = image.resize(scaled_size, PILImage.Resampling.LANCZOS)
 
-        input_tensor = transform(image).unsqueeze(0).to(device)
+        stage_start = time.time()
+        dtype = next(model.parameters()).dtype
+        input_tensor = transform(image).unsqueeze(0).to(device, dtype=dtype)
 
         with torch.no_grad():
-            preds = model(input_tensor)[-1].sigmoid().cpu()
+            preds = model(input_tensor)[-1].sigmoid().float().cpu()
+        stage_ms["inference"] += (time.time() - stage_start) * 1000
+        stage_start = time.time()
 
         mask_tensor = preds[0].squeeze()
         mask_np = mask_tensor.numpy()
@@ -165,17 +423,20 @@ def remove_background(context, **inputs) -> Dict[str, Any]:
         if mask_blur > 0:
             mask_pil = mask_pil.filter(ImageFilter.GaussianBlur(radius=mask_blur))
 
-        # Create final image with alpha channel
-        if scale_factor == 1.0:
-            final_frame = image.copy()
-        else:
-            # If we downscaled, reload original for final output
-            if original_image_bytes:
-                final_frame = PILImage.open(io.BytesIO(original_image_bytes)).convert("RGB")
+        # Create final image with alpha channel (mask-only output modes skip it)
+        final_frame = None
+        if needs_rgba:
+            if scale_factor == 1.0:
+                final_frame = image.copy()
             else:
-                final_frame = image.resize(original_frame_size, PILImage.Resampling.LANCZOS)
+                # If we downscaled, reload original for final output
+                if original_image_bytes:
+                    final_frame = PILImage.open(io.BytesIO(original_image_bytes)).convert("RGB")
+                else:
+                    final_frame = image.resize(original_frame_size, PILImage.Resampling.LANCZOS)
 
-        final_frame.putalpha(mask_pil)
+            final_frame.putalpha(mask_pil)
+        stage_ms["postprocess"] += (time.time() - stage_start) * 1000
 
         # Clear memory
         del input_tensor
@@ -185,24 +446,27 @@ def remove_background(context, **inputs) -> Dict[str, Any]:
         return final_frame, mask_pil
 
     # --- Process frames in batches for better GPU utilization ---
-    def _process_gif_frames_batch(frames: List[PILImage.Image], settings: dict, batch_size: int = 4) -> List[PILImage.Image]:
-        """Process GIF frames in batches for better performance"""
+    def _process_gif_frames_batch(frames: Iterable[PILImage.Image], settings: dict, total: int, batch_size: int = 4) -> List[PILImage.Image]:
+        """Process RGB animation frames in batches as they are decoded"""
         processed_frames = []
+        frames = iter(frames)
 
-        for i in range(0, len(frames), batch_size):
-            batch = frames[i:i + batch_size]
+        for i in itertools.count(0, batch_size):
+            batch = list(itertools.islice(frames, batch_size))
+            if not batch:
+                break
             batch_results = []
 
             for frame in batch:
-                result, _ = _process_single_frame(frame.convert("RGB"), settings)
+                result, _ = _process_single_frame(frame, settings)
                 batch_results.append(result)
 
             processed_frames.extend(batch_results)
 
-            # Log progress for long GIFs
-            if len(frames) > 50:
-                progress = (i + len(batch)) / len(frames) * 100
-                print(f"📊 Progress: {progress:.1f}% ({i + len(batch)}/{len(frames)} frames)")
+            # Log progress for long animations (total is the header estimate for videos)
+            if total > 50:
+                progress = min(100.0, (i + len(batch)) / total * 100)
+                print(f"📊 Progress: {progress:.1f}% ({i + len(batch)}/{total} frames)")
 
         return processed_frames
 
@@ -218,10 +482,26 @@ def remove_background(context, **inputs) -> Dict[str, Any]:
         # Get model from context
         model, transform, device = context.on_start_value
 
-        # Decode image
+        # Decode image headers (videos are only probed; frames are decoded while processing)
         try:
             image_bytes = base64.b64decode(inputs['image'])
-            image = PILImage.open(io.BytesIO(image_bytes))
+            is_video = _is_video(image_bytes)
+            if is_video:
+                video = _probe_video(image_bytes)
+                is_animated = True
+                # Unknown length (e.g. streamed WebM): assume the frame limit so admission control
+                # treats it as expensive; the limit itself is enforced while decoding
+                n_frames = video["n_frames"] or MAX_GIF_FRAMES
+                original_size = video["size"]
+                input_format = video["format"]
+                loop = 0
+            else:
+                image = PILImage.open(io.BytesIO(image_bytes))
+                is_animated = getattr(image, 'is_animated', False)
+                n_frames = getattr(image, 'n_frames', 1) if is_animated else 1
+                original_size = image.size
+                input_format = (image.format or "unknown").lower()
+                loop = image.info.get('loop', 0)
         except Exception as e:
             return {
                 "success": False,
@@ -229,23 +509,22 @@ def remove_background(context, **inputs) -> Dict[str, Any]:
                 "code": "INVALID_IMAGE"
             }
 
-        # Check if animated
-        is_animated = getattr(image, 'is_animated', False)
-        n_frames = getattr(image, 'n_frames', 1) if is_animated else 1
-        original_size = image.size
+        # Probe cost from the header (is_animated/n_frames/size) before decoding frames
+        estimated_ms = _estimate_cost(original_size, n_frames, is_animated)
 
-        # Validate image/GIF size
+        # Validate image/GIF/video size
         if is_animated:
+            source_label = "Video" if is_video else "GIF"
             if n_frames > MAX_GIF_FRAMES:
                 return {
                     "success": False,
-                    "error": f"GIF has too many frames ({n_frames}). Maximum is {MAX_GIF_FRAMES}.",
+                    "error": f"{source_label} has too many frames ({n_frames}). Maximum is {MAX_GIF_FRAMES}.",
                     "code": "TOO_MANY_FRAMES"
                 }
             if original_size[0] * original_size[1] > MAX_GIF_PIXELS:
                 return {
                     "success": False,
-                    "error": f"GIF frames are too large. Maximum is {MAX_GIF_PIXELS} pixels per frame.",
+                    "error": f"{source_label} frames are too large. Maximum is {MAX_GIF_PIXELS} pixels per frame.",
                     "code": "GIF_TOO_LARGE"
                 }
         else:
@@ -256,6 +535,28 @@ def remove_background(context, **inputs) -> Dict[str, Any]:
                     "code": "IMAGE_TOO_LARGE"
                 }
 
+        # Admission control: reject early instead of occupying the lane
+        lane_config = LANES[lane]
+        estimate_metadata = {
+            "lane": lane,
+            "estimated_cost_ms": estimated_ms,
+            "queue_wait_ms": queue_wait_ms,
+        }
+        if estimated_ms > lane_config["timeout"] * 1000:
+            return {
+                "success": False,
+                "error": f"Estimated processing time ({estimated_ms} ms) exceeds the {lane_config['timeout']}s timeout.",
+                "code": "ESTIMATED_TIMEOUT",
+                "metadata": estimate_metadata
+            }
+        if estimated_ms > lane_config["max_estimated_ms"] and inputs.get('bulk_lane') is True:
+            return {
+                "success": False,
+                "error": "Request is too expensive for the interactive lane. Submit it to the bulk endpoint.",
+                "code": "ROUTE_TO_BULK",
+                "metadata": estimate_metadata
+            }
+
         # Get processing parameters
         quality = inputs.get('quality', 'auto')
         if quality not in QUALITY_PRESETS:
@@ -268,52 +569,101 @@ def remove_background(context, **inputs) -> Dict[str, Any]:
             if param in inputs:
                 settings[param] = inputs[param]
 
+        output_mode = inputs.get('output_mode', 'image')
+        if output_mode not in OUTPUT_MODES:
+            output_mode = 'image'
+        if is_animated and output_mode != 'image':
+            return {
+                "success": False,
+                "error": f"Output mode '{output_mode}' is only supported for static images.",
+                "code": "UNSUPPORTED_OUTPUT_MODE"
+            }
+        needs_mask = output_mode != 'image' or inputs.get('return_mask', False)
+
+        # Crop to content: true or {'padding': px}; validated here so bad values fail before inference
+        crop_config = inputs.get('crop', False)
+        crop_padding = None  # None means no crop
+        valid_crop = crop_config is None or isinstance(crop_config, (bool, dict))
+        if isinstance(crop_config, dict):
+            crop_padding = crop_config.get('padding', 0)
+            valid_crop = isinstance(crop_padding, int) and not isinstance(crop_padding, bool) and crop_padding >= 0
+        elif crop_config is True:
+            crop_padding = 0
+        if not valid_crop:
+            return {
+                "success": False,
+                "error": "crop must be true, false or {'padding': px} with a non-negative integer padding.",
+                "code": "INVALID_CROP"
+            }
+
+        # Validate compositing options before spending time on inference
+        background = None
+        shadow = None
+        try:
+            if inputs.get('background') not in (None, False):
+                background = _parse_background(inputs['background'])
+            if inputs.get('shadow') not in (None, False):
+                shadow = _parse_shadow(inputs['shadow'])
+        except Exception as e:
+            return {
+                "success": False,
+                "error": f"Invalid background or shadow: {str(e)}",
+                "code": "INVALID_BACKGROUND"
+            }
+
         # Process image(s)
         final_image = None
         mask_pil = None
 
         if is_animated:
-            print(f"🎞️ Processing animated GIF with {n_frames} frames...")
-
-            # Extract all frames first
-            frames = []
-            durations = []
-            for frame in ImageSequence.Iterator(image):
-                frames.append(frame.copy())
-                durations.append(frame.info.get('duration', 100))
+            print(f"🎞️ Processing {input_format} animation with {n_frames} frames...")
 
-            # Process frames in batches
-            processed_frames = _process_gif_frames_batch(frames, settings)
+            # Stream frames from the decoder instead of extracting them all first
+            if is_video:
+                source = _iter_video_frames(image_bytes, video["duration"])
+            else:
+                # ImageSequence reuses one seeked image, so convert each frame before the next seek
+                source = ((frame.convert("RGB"), frame.info.get('duration', 100))
+                          for frame in ImageSequence.Iterator(image))
 
-            # Create output GIF
+            durations = []
+            too_many_frames = False
+
+            def _frames() -> Iterator[PILImage.Image]:
+                # Header frame counts can be missing or wrong for videos, so count while decoding
+                nonlocal too_many_frames
+                for index, (frame, duration) in enumerate(source):
+                    if index == MAX_GIF_FRAMES:
+                        too_many_frames = True
+                        return
+                    durations.append(duration)
+                    yield frame
+
+            # Process frames in batches; frames stay RGBA until the single final encode
+            processed_frames = _process_gif_frames_batch(_frames(), settings, n_frames)
+            if too_many_frames:
+                return {
+                    "success": False,
+                    "error": f"{source_label} has more than {MAX_GIF_FRAMES} frames. Maximum is {MAX_GIF_FRAMES}.",
+                    "code": "TOO_MANY_FRAMES"
+                }
             if processed_frames:
-                gif_buffer = io.BytesIO()
-                processed_frames[0].save(
-                    gif_buffer,
-                    format='GIF',
-                    save_all=True,
-                    append_images=processed_frames[1:],
-                    duration=durations,
-                    loop=image.info.get('loop', 0),
-                    transparency=0,
-                    disposal=2,
-                    optimize=True  # Optimize GIF size
-                )
-                gif_buffer.seek(0)
-                final_image = PILImage.open(gif_buffer)
+                final_image = processed_frames[0]
+            n_frames = len(processed_frames)
 
             # Clear memory
-            del frames, processed_frames
             gc.collect()
 
         else:
             print("🖼️ Processing static image...")
             image_rgb = image.convert("RGB")
-            final_image, mask_pil = _process_single_frame(image_rgb, settings, image_bytes)
+            final_image, mask_pil = _process_single_frame(image_rgb, settings, image_bytes,
+                                                          needs_rgba=output_mode == 'image')
 
-        # Handle resizing if requested
-        output_size = final_image.size if final_image else original_size
-        if 'resize' in inputs and isinstance(inputs['resize'], dict) and final_image:
+        # Handle resizing if requested (mask output modes only have mask_pil)
+        result_image = final_image or mask_pil
+        output_size = result_image.size if result_image else original_size
+        if 'resize' in inputs and isinstance(inputs['resize'], dict) and result_image:
             resize_config = inputs['resize']
             target_width = resize_config.get('width')
             target_height = resize_config.get('height')
@@ -329,32 +679,19 @@ def remove_background(context, **inputs) -> Dict[str, Any]:
                         target_height = int(target_width / aspect)
 
                 if is_animated:
-                    # Resize animated GIF frames
-                    resized_frames = []
-                    for frame in ImageSequence.Iterator(final_image):
-                        resized_frame = frame.resize((target_width, target_height), PILImage.Resampling.LANCZOS)
-                        resized_frames.append(resized_frame)
-
-                    gif_buffer = io.BytesIO()
-                    resized_frames[0].save(
-                        gif_buffer,
-                        format='GIF',
-                        save_all=True,
-                        append_images=resized_frames[1:],
-                        duration=durations if 'durations' in locals() else 100,
-                        loop=image.info.get('loop', 0),
-                        transparency=0,
-                        disposal=2,
-                        optimize=True
-                    )
-                    gif_buffer.seek(0)
-                    final_image = PILImage.open(gif_buffer)
+                    # Resize animated frames before encoding
+                    processed_frames = [
+                        frame.resize((target_width, target_height), PILImage.Resampling.LANCZOS)
+                        for frame in processed_frames
+                    ]
+                    final_image = processed_frames[0]
                 else:
-                    final_image = final_image.resize(
-                        (target_width, target_height),
-                        PILImage.Resampling.LANCZOS
-                    )
-                    if mask_pil and inputs.get('return_mask', False):
+                    if final_image:
+                        final_image = final_image.resize(
+                            (target_width, target_height),
+                            PILImage.Resampling.LANCZOS
+                        )
+                    if mask_pil and needs_mask:
                         mask_pil = mask_pil.resize(
                             (target_width, target_height),
                             PILImage.Resampling.LANCZOS
@@ -362,19 +699,82 @@ def remove_background(context, **inputs) -> Dict[str, Any]:
 
                 output_size = (target_width, target_height)
 
+        # Crop to the alpha bounding box (union over frames for animations) before encoding
+        crop_box = None
+        if crop_padding is not None and result_image:
+            if is_animated:
+                alpha_masks = [frame.getchannel('A') for frame in processed_frames]
+            else:
+                alpha_masks = [final_image.getchannel('A') if final_image else mask_pil]
+            crop_box = _content_bbox(alpha_masks, crop_padding, shadow if output_mode == 'image' else None)
+            if crop_box:
+                if is_animated:
+                    processed_frames = [frame.crop(crop_box) for frame in processed_frames]
+                    final_image = processed_frames[0]
+                else:
+                    if final_image:
+                        final_image = final_image.crop(crop_box)
+                    if mask_pil and needs_mask:
+                        mask_pil = mask_pil.crop(crop_box)
+                output_size = (crop_box[2] - crop_box[0], crop_box[3] - crop_box[1])
+
+        # Composite onto the replacement background and/or drop shadow before the single encode
+        if (background or shadow) and output_mode == 'image' and final_image:
+            static_backdrop = None
+            if background and background["type"] != "blur":
+                static_backdrop = _render_backdrop(background, final_image)
+
+            def _backdrop_for(frame: PILImage.Image) -> Optional[PILImage.Image]:
+                if background is None:
+                    return None
+                return static_backdrop or _render_backdrop(background, frame)
+
+            if is_animated:
+                processed_frames = [
+                    _composite(frame, _backdrop_for(frame), shadow).convert("RGBA")
+                    for frame in processed_frames
+                ]
+                final_image = processed_frames[0]
+            else:
+                final_image = _composite(final_image, _backdrop_for(final_image), shadow)
+
         # Encode output
-        output_format = 'gif' if is_animated else inputs.get('format', 'png').lower()
+        if is_animated:
+            output_format = str(inputs.get('animated_format', 'gif')).lower()
+            if output_format not in ANIMATED_FORMATS:
+                output_format = 'gif'
+        else:
+            output_format = inputs.get('format', 'png').lower()
         img_buffer = io.BytesIO()
+        encode_start = time.time()
+        mask_rle = None
 
-        if output_format == 'gif':
-            final_image.save(img_buffer, format='GIF', save_all=True, optimize=True)
+        if is_animated:
+            _encode_animation(processed_frames, durations, loop, output_format, img_buffer)
+            del processed_frames
+        elif output_mode == 'mask':
+            output_format = 'png'
+            mask_pil.save(img_buffer, format='PNG', optimize=True)
+        elif output_mode == 'mask_bitonal':
+            output_format = 'png'
+            bitonal = mask_pil.point(lambda v: 255 if v >= MASK_BINARY_THRESHOLD else 0).convert('1')
+            bitonal.save(img_buffer, format='PNG', optimize=True)
+        elif output_mode == 'mask_rle':
+            output_format = 'rle'
+            mask_rle = _encode_mask_rle(mask_pil)
         elif output_format == 'webp':
             final_image.save(img_buffer, format='WEBP', quality=95, method=6)
+        elif output_format in ('jpg', 'jpeg') and final_image.mode == 'RGB':
+            # Only opaque (composited) results can be JPEG
+            final_image.save(img_buffer, format='JPEG', quality=92, optimize=True)
         else:
+            output_format = 'png'
             final_image.save(img_buffer, format='PNG', optimize=True)
 
+        encode_time = int((time.time() - encode_start) * 1000)
+
         img_buffer.seek(0)
-        image_base64 = base64.b64encode(img_buffer.getvalue()).decode('utf-8')
+        image_base64 = base64.b64encode(img_buffer.getvalue()).decode('utf-8') if mask_rle is None else None
 
         # Prepare response
         processing_time = int((time.time() - start_time) * 1000)
@@ -386,16 +786,30 @@ def remove_background(context, **inputs) -> Dict[str, Any]:
                 "original_size": list(original_size),
                 "output_size": list(output_size),
                 "processing_time_ms": processing_time,
+                "encode_time_ms": encode_time,
+                "stage_times_ms": {
+                    "inference": int(stage_ms["inference"]),
+                    "postprocess": int(stage_ms["postprocess"]),
+                    "encode": encode_time,
+                },
                 "quality_used": quality,
                 "format": output_format,
+                "output_mode": output_mode,
+                "crop_box": list(crop_box) if crop_box else None,
+                "input_format": input_format,
                 "device": str(device),
                 "is_animated": is_animated,
                 "frame_count": n_frames,
+                **estimate_metadata,
             }
         }
 
-        # Add mask if requested (only for static images)
-        if inputs.get('return_mask', False) and mask_pil and not is_animated:
+        if mask_rle is not None:
+            del response['image']
+            response['mask_rle'] = mask_rle
+
+        # Add mask if requested (only for static images; mask modes already return it)
+        if inputs.get('return_mask', False) and mask_pil and not is_animated and output_mode == 'image':
             mask_buffer = io.BytesIO()
             mask_pil.save(mask_buffer, format='PNG', optimize=True)
             mask_buffer.seek(0)
@@ -415,6 +829,92 @@ def remove_background(context, **inputs) -> Dict[str, Any]:
             "trace": error_trace if inputs.get('debug', False) else None
         }
 
+
+WORKER_IMAGE = (
+    Image(python_version="python3.12")
+    .add_python_packages([
+        "torch==2.7.1",
+        "torchvision==0.22.1",
+        "transformers==4.52.4",
+        "scipy==1.15.3",
+        "pillow==11.2.1",
+        "numpy==2.3.0",
+        "timm==1.0.15",
+        "kornia==0.8.1",
+        "av==14.4.0"
+    ])
+)
+
+
+@endpoint(
+    name="bg-removal",
+    cpu=2,  # Increased for GIF processing
+    memory="8Gi",  # Increased for large GIFs
+    gpu="RTX4090",
+    image=WORKER_IMAGE,
+    volumes=[Volume(name="model_cache", mount_path="./model_cache")],
+    on_start=load_model,
+    secrets=["HUGGING_FACE_HUB_TOKEN"],
+    keep_warm_seconds=300,  # Keep warm for 5 minutes
+    max_pending_tasks=100,
+    timeout=INTERACTIVE_TIMEOUT,
+)
+def remove_background(context, **inputs) -> Dict[str, Any]:
+    """
+    Remove background from an image, animated GIF or short video (interactive lane).
+
+    When the caller has a bulk lane (bulk_lane=True), requests whose estimated
+    cost exceeds the interactive budget are rejected with code ROUTE_TO_BULK
+    before any frame is decoded; otherwise they are processed here.
+
+    Expected inputs:
+    - image: base64 encoded image data
+    - quality: preset name (default: 'auto')
+    - format: output format for static images (default: 'png')
+    - animated_format: output format for GIF/video input: 'gif', 'webp' or 'apng' (default: 'gif')
+    - return_mask: whether to return the mask (default: False)
+    - output_mode: 'image', 'mask' (8-bit PNG), 'mask_bitonal' (1-bit PNG) or 'mask_rle' (default: 'image')
+    - crop: crop to the alpha bounding box; true or {'padding': px} (default: False)
+    - background: composite onto {'type': 'color', 'color': '#fff'}, {'type': 'blur', 'radius': 20}
+      or {'type': 'image', 'image': base64}; opaque results can use format 'jpg'
+    - shadow: drop shadow; true or {'offset': [x, y], 'blur': px, 'opacity': 0-1, 'color': '#000'}
+    - resize: optional resize parameters
+    - submitted_at: optional client submission time (epoch seconds) for queue wait metrics
+    - bulk_lane: set by callers that can resubmit to bg-removal-bulk (default: False)
+
+    Returns:
+    - success: boolean
+    - image: base64 encoded result
+    - mask: base64 encoded mask (if requested)
+    - mask_rle: run-length encoded mask (output_mode 'mask_rle')
+    - error: error message (if failed)
+    - metadata: processing metadata (includes lane, estimated_cost_ms, queue_wait_ms, crop_box)
+    """
+    return _remove_background(context, inputs, lane="interactive")
+
+
+@endpoint(
+    name="bg-removal-bulk",
+    cpu=2,
+    memory="8Gi",
+    gpu="RTX4090",
+    image=WORKER_IMAGE,
+    volumes=[Volume(name="model_cache", mount_path="./model_cache")],
+    on_start=load_model,
+    secrets=["HUGGING_FACE_HUB_TOKEN"],
+    keep_warm_seconds=60,
+    max_pending_tasks=100,
+    timeout=BULK_TIMEOUT,
+)
+def remove_background_bulk(context, **inputs) -> Dict[str, Any]:
+    """
+    Remove background from long animations and other expensive jobs (bulk lane).
+
+    Takes the same inputs as remove_background; only requests estimated to
+    exceed the timeout are rejected (code ESTIMATED_TIMEOUT).
+    """
+    return _remove_background(context, inputs, lane="bulk")
+
 '''
 # Health check endpoint (lightweight)
 @endpoint(
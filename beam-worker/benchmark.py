@@ -0,0 +1,313 @@
+# benchmark.py
+"""
+Quality-vs-speed regression harness for the background removal pipeline.
+
+Runs a local folder of reference images with golden alpha masks through the
+real worker pipeline (app._remove_background) under every combination of
+quality preset, inference resolution and precision mode. For each run it
+records alpha quality (IoU / SAD / gradient error), per-stage latency and peak
+memory, then writes a Markdown comparison table and a JSON file that can be
+diffed between commits. Requests use the production output path (RGBA PNG),
+so the encode stage is what real requests pay; memory is sampled separately
+for every configuration.
+
+Golden masks are matched to images by file name stem, e.g.
+    refs/images/shoe.jpg  <->  refs/masks/shoe.png
+
+Usage:
+    python benchmark.py --images refs/images --masks refs/masks \\
+        --presets auto,speed --resolutions 1024,768 --precisions fp32,fp16 \\
+        --out results/ --baseline results/previous.json
+
+Needs the worker dependencies (torch, transformers, ...) installed locally;
+a CUDA GPU is required for fp16.
+"""
+
+import argparse
+import base64
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Optional
+
+# Make app.py import its heavy dependencies outside of Beam
+os.environ.setdefault("BG_WORKER_LOCAL", "1")
+
+import numpy as np
+import torch
+from PIL import Image as PILImage
+from scipy import ndimage
+
+import app
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp"}
+GRADIENT_SIGMA = 1.4  # Standard sigma for the matting gradient error
+RSS_SAMPLE_INTERVAL = 0.005  # Seconds between resident memory samples
+
+
+# --- Metrics ---
+def alpha_metrics(pred: np.ndarray, gt: np.ndarray) -> dict:
+    """IoU of binarized masks, SAD and gradient error (both in thousands, as in matting benchmarks)"""
+    pred = pred.astype(np.float64) / 255.0
+    gt = gt.astype(np.float64) / 255.0
+
+    pred_bin = pred >= 0.5
+    gt_bin = gt >= 0.5
+    union = np.logical_or(pred_bin, gt_bin).sum()
+    iou = np.logical_and(pred_bin, gt_bin).sum() / union if union else 1.0
+
+    sad = np.abs(pred - gt).sum() / 1000
+    grad = ((ndimage.gaussian_gradient_magnitude(pred, GRADIENT_SIGMA)
+             - ndimage.gaussian_gradient_magnitude(gt, GRADIENT_SIGMA)) ** 2).sum() / 1000
+
+    return {"iou": float(iou), "sad": float(sad), "grad": float(grad)}
+
+
+def current_rss_mb() -> Optional[float]:
+    """Current resident memory of this process, or None where /proc is not available"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1 << 20)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class RssSampler:
+    """
+    Samples resident memory in a background thread while one configuration runs.
+
+    ru_maxrss is a high-water mark for the whole process, so it cannot tell
+    configurations apart; sampling reports the peak within the block and how
+    far it rose above the memory already held when the block started.
+    """
+
+    def __init__(self, interval: float = RSS_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.start_mb = None
+        self.peak_mb = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def _sample(self):
+        rss = current_rss_mb()
+        if rss is not None:
+            self.peak_mb = max(self.peak_mb or 0.0, rss)
+
+    def __enter__(self):
+        self.start_mb = current_rss_mb()
+        self._sample()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+    @property
+    def growth_mb(self) -> Optional[float]:
+        return self.peak_mb - self.start_mb if self.start_mb is not None else None
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+# --- Dataset ---
+def load_references(images_dir: Path, masks_dir: Path) -> list:
+    """Pair every reference image with its golden mask"""
+    masks = {path.stem: path for path in masks_dir.iterdir() if path.suffix.lower() in IMAGE_EXTENSIONS}
+    references = []
+    for path in sorted(images_dir.iterdir()):
+        if path.suffix.lower() not in IMAGE_EXTENSIONS:
+            continue
+        if path.stem not in masks:
+            print(f"⚠️  No golden mask for '{path.name}', skipping")
+            continue
+        references.append((path, masks[path.stem]))
+    return references
+
+
+# --- Runs ---
+def run_config(pipeline: tuple, preset: str, references: list) -> dict:
+    """Run every reference through the worker pipeline and aggregate metrics"""
+    context = SimpleNamespace(on_start_value=pipeline)
+    device = pipeline[2]
+    if device.type == "cuda":
+        torch.cuda.reset_peak_memory_stats(device)
+
+    per_image = []
+    with RssSampler() as rss:
+        for image_path, mask_path in references:
+            # Same output path as production requests (RGBA PNG), so the encode stage is representative
+            inputs = {
+                "image": base64.b64encode(image_path.read_bytes()).decode("utf-8"),
+                "quality": preset,
+                "format": "png",
+            }
+            start = time.time()
+            response = app._remove_background(context, inputs, lane="bulk")
+            latency_ms = (time.time() - start) * 1000
+
+            if not response.get("success"):
+                print(f"❌ {image_path.name}: {response.get('code')} {response.get('error')}")
+                continue
+
+            pred = PILImage.open(io.BytesIO(base64.b64decode(response["image"]))).getchannel("A")
+            gt = PILImage.open(mask_path).convert("L")
+            if gt.size != pred.size:
+                gt = gt.resize(pred.size, PILImage.Resampling.BILINEAR)
+
+            result = {
+                "image": image_path.name,
+                "latency_ms": latency_ms,
+                "stage_times_ms": response["metadata"]["stage_times_ms"],
+                **alpha_metrics(np.asarray(pred), np.asarray(gt)),
+            }
+            per_image.append(result)
+
+    if not per_image:
+        return {"images": []}
+
+    latencies = sorted(r["latency_ms"] for r in per_image)
+    stages = per_image[0]["stage_times_ms"].keys()
+    return {
+        "iou": statistics.mean(r["iou"] for r in per_image),
+        "sad": statistics.mean(r["sad"] for r in per_image),
+        "grad": statistics.mean(r["grad"] for r in per_image),
+        "latency_ms": statistics.mean(latencies),
+        "latency_p50_ms": latencies[len(latencies) // 2],
+        "latency_p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        "stage_times_ms": {stage: statistics.mean(r["stage_times_ms"][stage] for r in per_image) for stage in stages},
+        "peak_gpu_mb": torch.cuda.max_memory_allocated(device) / (1 << 20) if device.type == "cuda" else None,
+        "peak_rss_mb": rss.peak_mb,
+        "rss_growth_mb": rss.growth_mb,
+        "images": per_image,
+    }
+
+
+# --- Reporting ---
+def config_key(preset: str, resolution: int, precision: str) -> str:
+    return f"{preset}/{resolution}/{precision}"
+
+
+def format_delta(value: float, baseline: dict, key: str, metric: str) -> str:
+    previous = baseline.get(key, {}).get(metric)
+    if previous is None:
+        return ""
+    return f" ({value - previous:+.3f})" if metric != "latency_ms" else f" ({value - previous:+.0f})"
+
+
+def render_table(results: dict, baseline: dict) -> str:
+    """Markdown comparison table; deltas against the baseline are shown in parentheses"""
+    lines = [
+        "| preset / resolution / precision | IoU ↑ | SAD ↓ | Grad ↓ | mean ms | p95 ms | inference ms | postprocess ms | encode ms | GPU MB | RSS MB (growth) |",
+        "|---|---|---|---|---|---|---|---|---|---|---|",
+    ]
+    for key, run in results.items():
+        if not run.get("images"):
+            lines.append(f"| {key} | - | - | - | - | - | - | - | - | - | - |")
+            continue
+        stages = run["stage_times_ms"]
+        gpu = f"{run['peak_gpu_mb']:.0f}" if run["peak_gpu_mb"] is not None else "-"
+        rss = f"{run['peak_rss_mb']:.0f} (+{run['rss_growth_mb']:.0f})" if run["peak_rss_mb"] is not None else "-"
+        lines.append(
+            f"| {key} "
+            f"| {run['iou']:.4f}{format_delta(run['iou'], baseline, key, 'iou')} "
+            f"| {run['sad']:.3f}{format_delta(run['sad'], baseline, key, 'sad')} "
+            f"| {run['grad']:.3f}{format_delta(run['grad'], baseline, key, 'grad')} "
+            f"| {run['latency_ms']:.0f}{format_delta(run['latency_ms'], baseline, key, 'latency_ms')} "
+            f"| {run['latency_p95_ms']:.0f} "
+            f"| {stages['inference']:.0f} | {stages['postprocess']:.0f} | {stages['encode']:.0f} "
+            f"| {gpu} | {rss} |"
+        )
+    return "\n".join(lines)
+
+
+def parse_list(value: str) -> list:
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+# --- Main Script ---
+def main():
+    parser = argparse.ArgumentParser(description="Quality-vs-speed regression harness")
+    parser.add_argument("--images", type=Path, required=True, help="Folder of reference images")
+    parser.add_argument("--masks", type=Path, required=True, help="Folder of golden alpha masks (same file stems)")
+    parser.add_argument("--presets", default=",".join(app.QUALITY_PRESETS), help="Comma-separated quality presets")
+    parser.add_argument("--resolutions", default=str(app.MODEL_RESOLUTION), help="Comma-separated inference resolutions")
+    parser.add_argument("--precisions", default=app.MODEL_PRECISION, help=f"Comma-separated precisions ({', '.join(app.PRECISIONS)})")
+    parser.add_argument("--out", type=Path, default=Path("benchmark_results"), help="Output folder")
+    parser.add_argument("--baseline", type=Path, help="Previous results.json to compare against")
+    args = parser.parse_args()
+
+    presets = parse_list(args.presets)
+    resolutions = [int(r) for r in parse_list(args.resolutions)]
+    precisions = parse_list(args.precisions)
+    for name, values, valid in (("preset", presets, app.QUALITY_PRESETS), ("precision", precisions, app.PRECISIONS)):
+        unknown = [v for v in values if v not in valid]
+        if unknown:
+            print(f"❌ Error: unknown {name}(s): {', '.join(unknown)}")
+            sys.exit(1)
+
+    references = load_references(args.images, args.masks)
+    if not references:
+        print("❌ Error: no reference images with golden masks found.")
+        sys.exit(1)
+    print(f"✅ Loaded {len(references)} reference images")
+
+    baseline = {}
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())["results"]
+
+    results = {}
+    for precision in precisions:
+        for resolution in resolutions:
+            pipeline = app.load_model(resolution=resolution, precision=precision)
+
+            # Warm-up so the first measured image does not pay for kernel selection
+            app._remove_background(
+                SimpleNamespace(on_start_value=pipeline),
+                {"image": base64.b64encode(references[0][0].read_bytes()).decode("utf-8")},
+                lane="bulk",
+            )
+
+            for preset in presets:
+                key = config_key(preset, resolution, precision)
+                print(f"📊 Running {key}...")
+                results[key] = run_config(pipeline, preset, references)
+
+            del pipeline
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+
+    args.out.mkdir(parents=True, exist_ok=True)
+    report = {
+        "commit": git_commit(),
+        "device": "cuda" if torch.cuda.is_available() else "cpu",
+        "image_count": len(references),
+        "results": results,
+    }
+    (args.out / "results.json").write_text(json.dumps(report, indent=2, sort_keys=True))
+
+    table = render_table(results, baseline)
+    (args.out / "results.md").write_text(f"# Benchmark @ {report['commit']}\n\n{table}\n")
+    print(table)
+    print(f"🎉 Results written to '{args.out}'")
+
+
+if __name__ == "__main__":
+    main()
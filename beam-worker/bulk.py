@@ -0,0 +1,353 @@
+# bulk.py
+"""
+Bulk background removal CLI built on test.py.
+
+Walks a directory (or reads a manifest of paths), submits images with bounded
+concurrency over a pooled HTTP session, handles both synchronous results and
+task_id responses (with adaptive polling backoff), and writes each output as
+soon as it completes. Progress is appended to a JSONL journal so an interrupted
+run can be resumed; failed items are retried with exponential backoff. Journal
+entries are keyed by the path relative to the input root, so a run can be
+resumed from any cwd. Ctrl-C stops polling and retries at once and waits only
+for requests already sent; a second Ctrl-C quits immediately.
+
+Usage:
+    python bulk.py catalog/ -o catalog_out/ --concurrency 16 --quality product
+    python bulk.py manifest.txt -o out/            # one path per line
+    python bulk.py catalog/ -o out/ --retry-failed  # only retry failures from the journal
+
+Reads BEAM_API_KEY and the endpoint from the environment / .env file: the bulk
+lane (BEAM_BULK_ENDPOINT_URL) when it is deployed, otherwise BEAM_ENDPOINT_URL;
+--endpoint overrides both (see mock_endpoint.py for running against a local mock).
+
+Outputs mirror the input tree and keep the source extension, e.g.
+catalog/shoes/a.jpg -> out/shoes/a.jpg.png, so a.jpg and a.png never collide.
+"""
+
+import argparse
+import base64
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from test import build_headers, submit_job, poll_task, TaskCancelled
+
+INPUT_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp", ".gif", ".mp4", ".webm"}
+OUTPUT_EXTENSIONS = {"png": ".png", "apng": ".png", "jpg": ".jpg", "jpeg": ".jpg", "webp": ".webp", "gif": ".gif"}
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+PROGRESS_EVERY = 25
+
+
+class JobError(Exception):
+    """A job failed; retryable errors are transient (network, throttling, timeouts)"""
+
+    def __init__(self, message, retryable=False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+# --- Inputs and journal ---
+def collect_inputs(source: Path, exclude: Path = None) -> list:
+    """Image paths from a directory (recursive, skipping exclude) or a manifest file with one path per line"""
+    if source.is_dir():
+        excluded = Path(os.path.abspath(exclude)) if exclude else None
+        return sorted(p for p in source.rglob("*") if p.is_file() and p.suffix.lower() in INPUT_EXTENSIONS
+                      and not (excluded and excluded in Path(os.path.abspath(p)).parents))
+
+    paths = []
+    for line in source.read_text().splitlines():
+        line = line.strip()
+        if line and not line.startswith("#"):
+            path = Path(line)
+            paths.append(path if path.is_absolute() else source.parent / path)
+    return list(dict.fromkeys(paths))  # Drop duplicate entries, keep manifest order
+
+
+def input_root(source: Path, paths: list) -> Path:
+    """Directory the output tree mirrors: the input directory, or the common parent of manifest entries"""
+    if source.is_dir():
+        return Path(os.path.abspath(source))
+    if not paths:
+        return Path(os.path.abspath(source.parent))
+    return Path(os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in paths]))
+
+
+def journal_key(path: Path, root: Path) -> str:
+    """Input path relative to the input root, so resuming does not depend on the cwd or how the source was spelled"""
+    return Path(os.path.abspath(path)).relative_to(root).as_posix()
+
+
+def load_journal(journal_path: Path) -> dict:
+    """Latest journal entry per input (keyed by journal_key)"""
+    entries = {}
+    if journal_path.exists():
+        with open(journal_path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Partially written line from an interrupted run
+                entries[entry["path"]] = entry
+    return entries
+
+
+def output_base_for(path: Path, root: Path, output_dir: Path) -> Path:
+    """Output path before the output extension; unique per input because the source extension is kept"""
+    return output_dir / Path(os.path.abspath(path)).relative_to(root)
+
+
+def output_path_for(path: Path, root: Path, output_dir: Path, output_format: str) -> Path:
+    base = output_base_for(path, root, output_dir)
+    return base.with_name(base.name + OUTPUT_EXTENSIONS.get(output_format, ".png"))
+
+
+def find_collisions(paths: list, root: Path, output_dir: Path) -> list:
+    """Groups of inputs that would write the same output (compared case-insensitively)"""
+    groups = {}
+    for path in paths:
+        groups.setdefault(str(output_base_for(path, root, output_dir)).lower(), []).append(path)
+    return [group for group in groups.values() if len(group) > 1]
+
+
+# --- Job execution (runs in worker threads) ---
+def process_one(session, endpoint_url, headers, path: Path, options: dict, timeout_seconds: float, stop) -> dict:
+    """Submit one image and wait for its result; returns the worker response"""
+    payload = {
+        "image": base64.b64encode(path.read_bytes()).decode("utf-8"),
+        "submitted_at": time.time(),
+        **options,
+    }
+
+    try:
+        response_data = submit_job(session, endpoint_url, headers, payload, timeout=timeout_seconds)
+        if "task_id" in response_data:
+            status_data = poll_task(session, endpoint_url, headers, response_data["task_id"],
+                                    timeout_seconds=timeout_seconds, stop_event=stop)
+            if status_data.get("status") != "COMPLETE":
+                raise JobError(f"Task failed: {status_data.get('outputs')}")
+            response_data = status_data.get("outputs") or {}
+    except requests.exceptions.HTTPError as e:
+        status = e.response.status_code if e.response is not None else None
+        raise JobError(f"HTTP {status}: {e}", retryable=status in RETRYABLE_STATUS)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, TimeoutError) as e:
+        raise JobError(str(e), retryable=True)
+    except requests.exceptions.RequestException as e:
+        raise JobError(str(e))
+
+    if not response_data.get("success") or not (response_data.get("image") or response_data.get("mask_rle")):
+        raise JobError(f"{response_data.get('code', 'UNKNOWN')}: {response_data.get('error', response_data)}")
+    return response_data
+
+
+def run_job(session, endpoint_url, headers, path, root, output_dir, options, timeout_seconds, retries, stop) -> dict:
+    """
+    Process one item with retries and write its output; returns a journal entry,
+    or None if the run was interrupted (stop is set) before the item finished.
+    """
+    start = time.time()
+    try:
+        return _run_job(session, endpoint_url, headers, path, root, output_dir, options, timeout_seconds, retries,
+                        stop, start)
+    except TaskCancelled:
+        return None
+    except Exception as e:  # Unreadable input, unwritable output, malformed response...
+        return {"path": journal_key(path, root), "status": "failed", "error": f"{type(e).__name__}: {e}",
+                "attempts": 1, "ms": int((time.time() - start) * 1000)}
+
+
+def _run_job(session, endpoint_url, headers, path, root, output_dir, options, timeout_seconds, retries, stop,
+             start) -> dict:
+    attempt = 0
+    while True:
+        if stop.is_set():
+            raise TaskCancelled(f"{path} was not submitted, the run was interrupted")
+        attempt += 1
+        try:
+            result = process_one(session, endpoint_url, headers, path, options, timeout_seconds, stop)
+            break
+        except JobError as e:
+            if not e.retryable or attempt > retries:
+                return {"path": journal_key(path, root), "status": "failed", "error": str(e), "attempts": attempt,
+                        "ms": int((time.time() - start) * 1000)}
+            delay = min(RETRY_BASE_DELAY * 2 ** (attempt - 1), RETRY_MAX_DELAY)
+            stop.wait(delay * random.uniform(0.5, 1.5))  # Returns early when the run is interrupted
+
+    output_format = result.get("metadata", {}).get("format", options.get("format", "png"))
+    if "mask_rle" in result:
+        base = output_base_for(path, root, output_dir)
+        output_path = base.with_name(base.name + ".json")
+        data = json.dumps(result["mask_rle"]).encode("utf-8")
+    else:
+        output_path = output_path_for(path, root, output_dir, output_format)
+        data = base64.b64decode(result["image"])
+
+    # Write to a temp file first so a crash never leaves a truncated output behind
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output_path.with_name(output_path.name + ".part")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, output_path)
+
+    return {"path": journal_key(path, root), "status": "done", "output": output_path.relative_to(output_dir).as_posix(),
+            "attempts": attempt,
+            "ms": int((time.time() - start) * 1000), "bytes_in": path.stat().st_size, "bytes_out": len(data)}
+
+
+# --- Main Script ---
+def main():
+    parser = argparse.ArgumentParser(description="Bulk background removal over a directory or manifest")
+    parser.add_argument("source", type=Path, help="Input directory or manifest file (one path per line)")
+    parser.add_argument("-o", "--output", type=Path, required=True, help="Output directory")
+    parser.add_argument("--journal", type=Path, help="Progress journal (default: <output>/progress.jsonl)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Maximum jobs in flight")
+    parser.add_argument("--retries", type=int, default=3, help="Retries per item for transient errors")
+    parser.add_argument("--retry-failed", action="store_true", help="Only process items that failed previously")
+    parser.add_argument("--timeout", type=float, default=180, help="Per-job timeout in seconds")
+    parser.add_argument("--quality", default="auto")
+    parser.add_argument("--format", default="png")
+    parser.add_argument("--animated-format", default=None, help="gif, webp or apng for animated inputs")
+    parser.add_argument("--output-mode", default=None, help="image, mask, mask_bitonal or mask_rle")
+    parser.add_argument("--crop", action="store_true", help="Crop outputs to the subject")
+    parser.add_argument("--endpoint", help="Endpoint URL (default: BEAM_BULK_ENDPOINT_URL, else BEAM_ENDPOINT_URL)")
+    args = parser.parse_args()
+
+    # Prefer the bulk lane so long animations are not rejected with ROUTE_TO_BULK
+    # and a backfill does not queue in front of interactive requests
+    endpoint_url = args.endpoint or os.getenv("BEAM_BULK_ENDPOINT_URL") or os.getenv("BEAM_ENDPOINT_URL")
+    api_key = os.getenv("BEAM_API_KEY")
+    if not endpoint_url or not api_key:
+        print("❌ Error: BEAM_BULK_ENDPOINT_URL (or BEAM_ENDPOINT_URL) and BEAM_API_KEY must be set in your .env file.")
+        sys.exit(1)
+    if not args.source.exists():
+        print(f"❌ Error: Input not found at '{args.source}'")
+        sys.exit(1)
+
+    inputs = collect_inputs(args.source, exclude=args.output)
+    root = input_root(args.source, inputs)
+
+    # Refuse to start if two inputs would overwrite each other's output
+    collisions = find_collisions(inputs, root, args.output)
+    if collisions:
+        print(f"❌ Error: {len(collisions)} output name collision(s), rename the inputs first:")
+        for group in collisions:
+            print(f"    {', '.join(str(path) for path in group)}")
+        sys.exit(1)
+
+    journal_path = args.journal or args.output / "progress.jsonl"
+    journal = load_journal(journal_path)
+
+    # Resume: skip finished items, and with --retry-failed only take previous failures
+    pending = []
+    for path in inputs:
+        entry = journal.get(journal_key(path, root))
+        if entry and entry["status"] == "done" and (args.output / entry["output"]).exists():
+            continue
+        if args.retry_failed and not (entry and entry["status"] == "failed"):
+            continue
+        pending.append(path)
+
+    options = {"quality": args.quality, "format": args.format}
+    if args.animated_format:
+        options["animated_format"] = args.animated_format
+    if args.output_mode:
+        options["output_mode"] = args.output_mode
+    if args.crop:
+        options["crop"] = True
+
+    print(f"🚀 {len(pending)} items to process ({len(journal)} already in journal), concurrency {args.concurrency}")
+    print(f"📡 Endpoint: {endpoint_url}")
+    if not pending:
+        return
+
+    # One pooled session shared by all workers (keep-alive, no per-request TLS handshakes)
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=args.concurrency, pool_maxsize=args.concurrency)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    headers = build_headers(api_key)
+
+    args.output.mkdir(parents=True, exist_ok=True)
+    journal_path.parent.mkdir(parents=True, exist_ok=True)
+    stats = {"done": 0, "failed": 0, "bytes_in": 0, "bytes_out": 0}
+    latencies = []
+    start_time = time.time()
+
+    # Set on Ctrl-C; workers check it before each attempt and while polling or backing off
+    stop = threading.Event()
+
+    with open(journal_path, "a") as journal_file, ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        items = iter(pending)
+        in_flight = set()
+
+        def _submit_next():
+            path = next(items, None)
+            if path is not None:
+                in_flight.add(executor.submit(run_job, session, endpoint_url, headers, path, root,
+                                              args.output, options, args.timeout, args.retries, stop))
+
+        def _record(entry):
+            if entry is None:  # Interrupted before finishing, stays pending for the next run
+                return
+            journal_file.write(json.dumps(entry) + "\n")
+            journal_file.flush()
+
+            stats[entry["status"]] += 1
+            if entry["status"] == "done":
+                stats["bytes_in"] += entry["bytes_in"]
+                stats["bytes_out"] += entry["bytes_out"]
+                latencies.append(entry["ms"])
+            else:
+                print(f"❌ {entry['path']}: {entry['error']}")
+
+        # Keep the queue bounded so 100k-item catalogs are not materialized as futures
+        for _ in range(args.concurrency):
+            _submit_next()
+
+        try:
+            while in_flight:
+                completed, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    _record(future.result())
+
+                    finished = stats["done"] + stats["failed"]
+                    if finished and finished % PROGRESS_EVERY == 0:
+                        rate = finished / (time.time() - start_time)
+                        print(f"📊 {finished}/{len(pending)} ({rate:.1f} items/s, {stats['failed']} failed)")
+                    _submit_next()
+        except KeyboardInterrupt:
+            stop.set()
+            print(f"🛑 Interrupted; waiting for {len(in_flight)} in-flight requests (Ctrl-C again to quit now).")
+            try:
+                # Pollers and backoffs return at once; only requests already on the wire are awaited
+                for future in in_flight:
+                    _record(future.result())
+            except KeyboardInterrupt:
+                journal_file.flush()
+                os._exit(130)  # Skip joining worker threads blocked in HTTP requests
+            print("   Finished items are in the journal, rerun the same command to resume.")
+            sys.exit(130)
+
+    # Aggregate throughput
+    elapsed = time.time() - start_time
+    latencies.sort()
+    print(f"🎉 Done in {elapsed:.1f}s: {stats['done']} succeeded, {stats['failed']} failed")
+    print(f"   Throughput: {(stats['done'] + stats['failed']) / elapsed:.2f} items/s, "
+          f"{stats['bytes_in'] / elapsed / (1 << 20):.2f} MB/s in, {stats['bytes_out'] / elapsed / (1 << 20):.2f} MB/s out")
+    if latencies:
+        print(f"   Latency: p50 {latencies[len(latencies) // 2]} ms, "
+              f"p95 {latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]} ms")
+    if stats["failed"]:
+        print(f"   Retry failures with: python bulk.py {args.source} -o {args.output} --retry-failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# gif_encoder.py
+"""
+Shared-palette GIF writer used by the worker for animated output.
+
+Only depends on Pillow and numpy, so it can be imported and tested without
+the model stack.
+"""
+import io
+from typing import List, Tuple
+
+import numpy as np
+from PIL import Image as PILImage
+
+# Writer settings
+GIF_TRANSPARENT_INDEX = 0  # Reserved palette slot for pixels below the alpha cutoff
+GIF_EMPTY_INDEX = 255  # Second transparent slot, used to write fully transparent frames
+GIF_ALPHA_CUTOFF = 128  # GIF only has 1-bit alpha
+GIF_PALETTE_SAMPLE_FRAMES = 16  # Frames sampled to build the shared palette
+GIF_PALETTE_SAMPLE_PIXELS = 16_384  # Opaque pixels sampled per frame
+GIF_LUT_BITS = 5  # Nearest-colour lookup table resolution per channel
+
+
+def _build_gif_palette(frames: List[PILImage.Image]) -> Tuple[np.ndarray, np.ndarray]:
+    """Build one shared palette from sampled frames, returns (palette, flat RGB lookup table)"""
+    step = max(1, len(frames) // GIF_PALETTE_SAMPLE_FRAMES)
+    samples = []
+    for frame in frames[::step]:
+        rgba = np.asarray(frame).reshape(-1, 4)
+        opaque = rgba[rgba[:, 3] >= GIF_ALPHA_CUTOFF, :3]
+        if len(opaque) > GIF_PALETTE_SAMPLE_PIXELS:
+            opaque = opaque[::len(opaque) // GIF_PALETTE_SAMPLE_PIXELS]
+        samples.append(opaque)
+
+    samples = np.concatenate(samples) if samples else np.zeros((0, 3), dtype=np.uint8)
+    if len(samples) == 0:
+        samples = np.zeros((1, 3), dtype=np.uint8)
+
+    # Quantize the sample only; two slots are left for transparency
+    sample_image = PILImage.fromarray(np.ascontiguousarray(samples.reshape(1, -1, 3)), mode='RGB')
+    quantized = sample_image.quantize(colors=254, method=PILImage.Quantize.FASTOCTREE)
+    palette = np.array(quantized.getpalette(), dtype=np.uint8).reshape(-1, 3)[:254]
+    palette = np.unique(palette, axis=0)
+
+    # Nearest palette colour for every cell of a coarse RGB cube: |a-b|^2 = |a|^2 - 2ab + |b|^2
+    levels = (np.arange(1 << GIF_LUT_BITS) << (8 - GIF_LUT_BITS)) + (1 << (7 - GIF_LUT_BITS))
+    grid = np.stack(np.meshgrid(levels, levels, levels, indexing='ij'), axis=-1).reshape(-1, 3).astype(np.float32)
+    palette_f = palette.astype(np.float32)
+    distances = (grid ** 2).sum(axis=1, keepdims=True) - 2 * grid @ palette_f.T + (palette_f ** 2).sum(axis=1)
+    lut = (distances.argmin(axis=1) + 1).astype(np.uint8)  # shift past the transparent index
+
+    return palette, lut
+
+
+def encode_gif(frames: List[PILImage.Image], durations: List[int], loop: int, buffer: io.BytesIO) -> None:
+    """
+    Encode RGBA frames as an animated GIF with a single shared palette.
+
+    Pixels are mapped through a vectorized lookup table instead of per-frame
+    quantization, so colours stay stable between frames (no flicker). Frames
+    that only add or change opaque pixels keep the previous frame (disposal=1),
+    which lets Pillow emit just the changed region. Repeated frames are
+    merged into the frame before them.
+    """
+    palette, lut = _build_gif_palette(frames)
+    shift = 8 - GIF_LUT_BITS
+
+    # Pillow matches palette entries by colour, so the transparent slot and padding must be unique
+    used_colors = {tuple(color) for color in palette.tolist()}
+    fillers = [color for color in ((i, 255 - i, 1) for i in range(256)) if color not in used_colors]
+    palette_bytes = bytes(fillers[0]) + palette.tobytes()  # index 0 is the transparent slot
+    palette_bytes += b"".join(bytes(color) for color in fillers[1:256 - len(palette)])  # ends with GIF_EMPTY_INDEX
+
+    indexed_frames = []
+    frame_durations = []
+    disposals = []
+    previous = None
+    for frame, duration in zip(frames, durations):
+        rgba = np.asarray(frame)
+        r, g, b = (rgba[..., c] >> shift for c in range(3))
+        indices = lut.take((r.astype(np.uint16) << (2 * GIF_LUT_BITS)) | (g.astype(np.uint16) << GIF_LUT_BITS) | b)
+        indices[rgba[..., 3] < GIF_ALPHA_CUTOFF] = GIF_TRANSPARENT_INDEX
+
+        if previous is not None:
+            # Merge repeated frames into the one before instead of leaving it to Pillow,
+            # so the disposal list stays aligned with the frames actually written
+            if np.array_equal(previous, indices):
+                frame_durations[-1] += duration
+                continue
+
+            # The previous frame must be cleared if any of its pixels turn transparent
+            cleared = np.any((previous != GIF_TRANSPARENT_INDEX) & (indices == GIF_TRANSPARENT_INDEX))
+            disposals.append(2 if cleared else 1)
+        previous = indices
+
+        # Pillow compares a frame after a cleared one against a canvas of the transparent index;
+        # an empty frame would match it and be written as a second global header, truncating
+        # the animation, so it is drawn with the spare transparent slot instead
+        transparency = GIF_TRANSPARENT_INDEX
+        if indexed_frames and not indices.any():
+            transparency = GIF_EMPTY_INDEX
+            indices = np.full_like(indices, GIF_EMPTY_INDEX)
+
+        indexed = PILImage.fromarray(indices, mode='P')
+        indexed.putpalette(palette_bytes)
+        indexed.info["transparency"] = transparency  # Per frame, so not passed to save()
+        indexed_frames.append(indexed)
+        frame_durations.append(duration)
+    disposals.append(2)  # Clear before looping back to the first frame
+
+    # Disposal 2 only clears the frame's own rectangle, so a cleared frame must not be a delta:
+    # clearing its predecessor too makes Pillow write it in full
+    for i in range(1, len(disposals)):
+        if disposals[i] == 2:
+            disposals[i - 1] = 2
+
+    # A single frame is written without per-frame options, which must then be scalars
+    if len(indexed_frames) == 1:
+        frame_durations, disposals = frame_durations[0], disposals[0]
+
+    indexed_frames[0].save(
+        buffer,
+        format='GIF',
+        save_all=True,
+        append_images=indexed_frames[1:],
+        duration=frame_durations,
+        loop=loop,
+        disposal=disposals,
+        palette=palette_bytes,  # Global colour table only, no per-frame local palettes
+        optimize=True  # Fills unchanged pixels of disposal=1 frames with the transparent index
+    )
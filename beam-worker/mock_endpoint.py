@@ -0,0 +1,121 @@
+# mock_endpoint.py
+"""
+Local mock of the Beam bg-removal endpoint for exercising bulk.py / test.py
+without a GPU deployment.
+
+POST /            -> either a synchronous result or {"task_id": ...}
+GET  /<task_id>   -> {"status": "PENDING" | "RUNNING" | "COMPLETE" | "FAILED", ...}
+
+The "result" is the input image echoed back, so outputs are valid images.
+
+Usage:
+    python mock_endpoint.py --port 8765 --async-ratio 0.5 --fail-ratio 0.05
+    BEAM_ENDPOINT_URL=http://127.0.0.1:8765 BEAM_API_KEY=mock-api-key python bulk.py images/ -o out/
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TASKS = {}
+TASKS_LOCK = threading.Lock()
+
+
+def make_result(payload):
+    return {
+        "success": True,
+        "image": payload.get("image", ""),
+        "metadata": {
+            "format": payload.get("format", "png"),
+            "processing_time_ms": 0,
+            "lane": "mock",
+        }
+    }
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    config = None  # argparse namespace, set in main()
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"success": False, "error": "Invalid JSON", "code": "INVALID_REQUEST"})
+            return
+
+        if random.random() < self.config.throttle_ratio:
+            self._send_json(429, {"error": "Too many pending tasks"})
+            return
+
+        if random.random() < self.config.async_ratio:
+            task_id = str(uuid.uuid4())
+            with TASKS_LOCK:
+                TASKS[task_id] = {
+                    "ready_at": time.time() + random.uniform(0, self.config.max_delay),
+                    "failed": random.random() < self.config.fail_ratio,
+                    "payload": payload,
+                }
+            self._send_json(200, {"task_id": task_id})
+            return
+
+        time.sleep(random.uniform(0, self.config.max_delay / 4))
+        if random.random() < self.config.fail_ratio:
+            self._send_json(200, {"success": False, "error": "Mock processing failure", "code": "PROCESSING_ERROR"})
+            return
+        self._send_json(200, make_result(payload))
+
+    def do_GET(self):
+        task_id = self.path.strip("/").split("/")[-1]
+        with TASKS_LOCK:
+            task = TASKS.get(task_id)
+        if task is None:
+            self._send_json(404, {"error": "Unknown task"})
+            return
+
+        if time.time() < task["ready_at"]:
+            self._send_json(200, {"task_id": task_id, "status": "RUNNING"})
+        elif task["failed"]:
+            self._send_json(200, {"task_id": task_id, "status": "FAILED",
+                                  "outputs": {"success": False, "error": "Mock processing failure"}})
+        else:
+            self._send_json(200, {"task_id": task_id, "status": "COMPLETE", "outputs": make_result(task["payload"])})
+
+    def log_message(self, format, *args):
+        if self.config.verbose:
+            super().log_message(format, *args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mock of the Beam bg-removal endpoint")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--async-ratio", type=float, default=0.5, help="Share of requests answered with a task_id")
+    parser.add_argument("--fail-ratio", type=float, default=0.0, help="Share of jobs that fail")
+    parser.add_argument("--throttle-ratio", type=float, default=0.0, help="Share of submissions rejected with HTTP 429")
+    parser.add_argument("--max-delay", type=float, default=2.0, help="Maximum simulated processing time (s)")
+    parser.add_argument("--verbose", action="store_true")
+    MockHandler.config = parser.parse_args()
+
+    server = ThreadingHTTPServer((MockHandler.config.host, MockHandler.config.port), MockHandler)
+    print(f"🧪 Mock endpoint listening on http://{MockHandler.config.host}:{MockHandler.config.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("🛑 Shutting down mock endpoint")
+
+
+if __name__ == "__main__":
+    main()
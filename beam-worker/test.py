@@ -26,6 +26,61 @@ INPUT_IMAGE_PATH = "goresh.png"  # Or "test.jpg", etc.
 # The output will be a transparent PNG
 OUTPUT_IMAGE_PATH = "test_output.png"
 
+# Adaptive polling: start fast for quick jobs, back off for long (animated) ones
+POLL_INITIAL_INTERVAL = 0.25
+POLL_MAX_INTERVAL = 5.0
+POLL_BACKOFF = 1.5
+
+
+# --- Request helpers (shared with bulk.py) ---
+class TaskCancelled(Exception):
+    """Polling was stopped through stop_event before the task finished"""
+
+
+def build_headers(api_key):
+    return {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+
+
+def submit_job(session, endpoint_url, headers, payload, timeout=60):
+    """Submit a job and return the decoded JSON response (sync result or task_id)"""
+    response = session.post(endpoint_url, headers=headers, json=payload, timeout=timeout)
+    response.raise_for_status()  # Raises an exception for bad status codes (4xx or 5xx)
+    return response.json()
+
+
+def poll_task(session, endpoint_url, headers, task_id, timeout_seconds=180, on_status=None, stop_event=None):
+    """
+    Poll an asynchronous task until it is COMPLETE or FAILED, with exponential backoff.
+    Returns the final status payload; raises TimeoutError if the task does not finish in time,
+    or TaskCancelled as soon as the optional stop_event (threading.Event) is set.
+    """
+    status_url = f"{endpoint_url}/{task_id}"
+    start_time = time.time()
+    interval = POLL_INITIAL_INTERVAL
+
+    while time.time() - start_time < timeout_seconds:
+        poll_response = session.get(status_url, headers=headers, timeout=30)
+        poll_response.raise_for_status()
+        status_data = poll_response.json()
+        status = status_data.get("status")
+
+        if status in ("COMPLETE", "FAILED"):
+            return status_data
+        if on_status:
+            on_status(status)
+
+        delay = min(interval, max(0.0, timeout_seconds - (time.time() - start_time)))
+        if stop_event is None:
+            time.sleep(delay)
+        elif stop_event.wait(delay):
+            raise TaskCancelled(f"Stopped polling task {task_id}")
+        interval = min(interval * POLL_BACKOFF, POLL_MAX_INTERVAL)
+
+    raise TimeoutError(f"Task {task_id} did not finish within {timeout_seconds}s")
+
 
 # --- Main Script ---
 def main():
@@ -47,10 +102,7 @@ def main():
         print(f"✅ Read and encoded '{INPUT_IMAGE_PATH}'")
 
     # 3. Prepare request payload and headers
-    headers = {
-        "Authorization": f"Bearer {BEAM_API_KEY}",
-        "Content-Type": "application/json"
-    }
+    headers = build_headers(BEAM_API_KEY)
     payload = {
         "image": image_b64,
         "quality": "quality",  # Using a high-quality setting
@@ -59,17 +111,16 @@ def main():
 
     # 4. Submit the initial job request
     print(f"📡 Submitting job to {BEAM_ENDPOINT_URL}...")
+    session = requests.Session()
     try:
-        response = requests.post(BEAM_ENDPOINT_URL, headers=headers, json=payload)
-        response.raise_for_status()  # Raises an exception for bad status codes (4xx or 5xx)
-        response_data = response.json()
+        response_data = submit_job(session, BEAM_ENDPOINT_URL, headers, payload)
 
+    except requests.exceptions.JSONDecodeError as e:
+        print(f"❌ Error: Failed to decode JSON from response. Response text: {e.doc}")
+        sys.exit(1)
     except requests.exceptions.RequestException as e:
         print(f"❌ Network or request error during submission: {e}")
         sys.exit(1)
-    except requests.exceptions.JSONDecodeError:
-        print(f"❌ Error: Failed to decode JSON from response. Response text: {response.text}")
-        sys.exit(1)
 
     # 5. Handle the response: could be synchronous or asynchronous
     final_image_b64 = None
@@ -80,34 +131,24 @@ def main():
         print(f"✅ Job submitted asynchronously! Task ID: {task_id}")
         print("⏳ Polling for results...")
 
-        status_url = f"{BEAM_ENDPOINT_URL}/{task_id}"
-        start_time = time.time()
-        timeout_seconds = 180  # 3 minutes for static images
-
-        while time.time() - start_time < timeout_seconds:
-            try:
-                poll_response = requests.get(status_url, headers=headers)
-                poll_response.raise_for_status()
-                status_data = poll_response.json()
-                status = status_data.get("status")
-
-                if status == "COMPLETE":
-                    print("✅ Task complete!")
-                    final_image_b64 = status_data.get("outputs", {}).get("image")
-                    if not final_image_b64:
-                        print(f"❌ Error: Task completed but no image was returned. Full output: {status_data}")
-                    break
-                elif status == "FAILED":
-                    print(f"❌ Task failed. Reason: {status_data.get('outputs')}")
-                    break
-                else:
-                    print(f"   Current status: {status}... waiting")
-                    time.sleep(2)  # Poll more frequently for static images
-
-            except requests.exceptions.RequestException as e:
-                print(f"❌ Network or request error during polling: {e}")
-                break
-        else:
+        try:
+            status_data = poll_task(
+                session, BEAM_ENDPOINT_URL, headers, task_id,
+                timeout_seconds=180,  # 3 minutes for static images
+                on_status=lambda status: print(f"   Current status: {status}... waiting")
+            )
+
+            if status_data.get("status") == "COMPLETE":
+                print("✅ Task complete!")
+                final_image_b64 = status_data.get("outputs", {}).get("image")
+                if not final_image_b64:
+                    print(f"❌ Error: Task completed but no image was returned. Full output: {status_data}")
+            else:
+                print(f"❌ Task failed. Reason: {status_data.get('outputs')}")
+
+        except requests.exceptions.RequestException as e:
+            print(f"❌ Network or request error during polling: {e}")
+        except TimeoutError:
             print("❌ Polling timed out after 3 minutes.")
 
     elif "image" in response_data and response_data.get("success"):
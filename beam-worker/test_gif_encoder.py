@@ -0,0 +1,94 @@
+# test_gif_encoder.py
+"""
+Round-trip checks for the shared-palette GIF writer (gif_encoder.encode_gif).
+
+Only needs Pillow and numpy:
+    python -m pytest test_gif_encoder.py
+"""
+
+import io
+
+import numpy as np
+import pytest
+from PIL import Image as PILImage, ImageSequence
+
+from gif_encoder import GIF_ALPHA_CUTOFF, encode_gif
+
+SIZE = (32, 32)
+RED = (220, 30, 30, 255)
+GREEN = (30, 200, 60, 255)
+
+
+def make_frame(*boxes):
+    """RGBA frame, transparent except for the given (box, colour) pairs"""
+    frame = PILImage.new("RGBA", SIZE, (0, 0, 0, 0))
+    for box, color in boxes:
+        frame.paste(color, box)
+    return frame
+
+
+def round_trip(frames, durations):
+    buffer = io.BytesIO()
+    encode_gif(frames, durations, 0, buffer)
+    buffer.seek(0)
+    gif = PILImage.open(buffer)
+
+    decoded = []
+    for frame in ImageSequence.Iterator(gif):
+        decoded.append({
+            "alpha": np.asarray(frame.convert("RGBA"))[..., 3] >= GIF_ALPHA_CUTOFF,
+            "duration": frame.info.get("duration"),
+            "disposal": frame.disposal_method,
+        })
+    return decoded
+
+
+def visible(frame):
+    return np.asarray(frame)[..., 3] >= GIF_ALPHA_CUTOFF
+
+
+def test_disposal_keeps_or_clears_previous_frame():
+    red = ((0, 0, 12, 12), RED)
+    green = ((20, 20, 32, 32), GREEN)
+    blue = ((0, 20, 12, 32), (30, 60, 220, 255))
+    # Frames 1 and 2 only add pixels, frame 3 drops the red square. Frame 2 must be cleared,
+    # and frame 1 is cleared too so that frame 2 is written in full rather than as a delta
+    frames = [make_frame(red), make_frame(red, green), make_frame(red, green, blue), make_frame(green)]
+
+    decoded = round_trip(frames, [100] * len(frames))
+
+    assert [d["disposal"] for d in decoded] == [1, 2, 2, 2]
+    for expected, d in zip(frames, decoded):
+        assert np.array_equal(d["alpha"], visible(expected))
+
+
+def test_repeated_frames_are_merged():
+    red = make_frame(((0, 0, 16, 16), RED))
+    green = make_frame(((16, 16, 32, 32), GREEN))
+
+    decoded = round_trip([red, red.copy(), green], [100, 100, 50])
+
+    assert [d["duration"] for d in decoded] == [200, 50]
+    assert np.array_equal(decoded[0]["alpha"], visible(red))
+    assert np.array_equal(decoded[1]["alpha"], visible(green))
+
+
+@pytest.mark.parametrize("n_frames", [1, 3])
+def test_all_transparent_input(n_frames):
+    frames = [make_frame() for _ in range(n_frames)]
+
+    decoded = round_trip(frames, [100] * n_frames)
+
+    assert len(decoded) == 1
+    assert not decoded[0]["alpha"].any()
+
+
+def test_empty_frame_between_visible_frames():
+    red = make_frame(((0, 0, 16, 16), RED))
+    frames = [red, make_frame(), red.copy()]
+
+    decoded = round_trip(frames, [100, 100, 100])
+
+    assert len(decoded) == 3
+    for expected, d in zip(frames, decoded):
+        assert np.array_equal(d["alpha"], visible(expected))
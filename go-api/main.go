@@ -26,28 +26,37 @@ import (
 
 // Configuration
 type Config struct {
-	BeamEndpoint string
-	BeamAPIKey   string
-	ServerPort   string
-	Environment  string
-	MaxFileSize  int64
-	Timeout      time.Duration
+	BeamEndpoint     string
+	BeamBulkEndpoint string // optional bulk lane for long animated jobs
+	BeamAPIKey       string
+	ServerPort       string
+	Environment      string
+	MaxFileSize      int64
+	Timeout          time.Duration
 }
 
 // Request/Response types for Beam API
 type BeamRequest struct {
-	Image      string                 `json:"image"`
-	Quality    string                 `json:"quality,omitempty"`
-	Format     string                 `json:"format,omitempty"`
-	ReturnMask bool                   `json:"return_mask,omitempty"`
-	Resize     map[string]interface{} `json:"resize,omitempty"`
-	Debug      bool                   `json:"debug,omitempty"`
+	Image          string                 `json:"image"`
+	Quality        string                 `json:"quality,omitempty"`
+	Format         string                 `json:"format,omitempty"`
+	AnimatedFormat string                 `json:"animated_format,omitempty"`
+	ReturnMask     bool                   `json:"return_mask,omitempty"`
+	OutputMode     string                 `json:"output_mode,omitempty"`
+	Crop           interface{}            `json:"crop,omitempty"`
+	Background     interface{}            `json:"background,omitempty"`
+	Shadow         interface{}            `json:"shadow,omitempty"`
+	Resize         map[string]interface{} `json:"resize,omitempty"`
+	Debug          bool                   `json:"debug,omitempty"`
+	SubmittedAt    float64                `json:"submitted_at,omitempty"`
+	BulkLane       bool                   `json:"bulk_lane,omitempty"`
 }
 
 type BeamResponse struct {
 	Success  bool                   `json:"success"`
 	Image    string                 `json:"image,omitempty"`
 	Mask     string                 `json:"mask,omitempty"`
+	MaskRLE  map[string]interface{} `json:"mask_rle,omitempty"`
 	TaskID   string                 `json:"task_id,omitempty"`
 	Error    string                 `json:"error,omitempty"`
 	Code     string                 `json:"code,omitempty"`
@@ -56,17 +65,23 @@ type BeamResponse struct {
 
 // SDK-friendly API request/response types
 type APIRequest struct {
-	ImageData     string                 `json:"image_data" binding:"required"`
-	Quality       string                 `json:"quality"`
-	Format        string                 `json:"format"`
-	ReturnMask    bool                   `json:"return_mask"`
-	ResizeOptions map[string]interface{} `json:"resize_options,omitempty"`
+	ImageData      string                 `json:"image_data" binding:"required"`
+	Quality        string                 `json:"quality"`
+	Format         string                 `json:"format"`
+	AnimatedFormat string                 `json:"animated_format,omitempty"`
+	ReturnMask     bool                   `json:"return_mask"`
+	OutputMode     string                 `json:"output_mode,omitempty"`
+	Crop           interface{}            `json:"crop,omitempty"`
+	Background     interface{}            `json:"background,omitempty"`
+	Shadow         interface{}            `json:"shadow,omitempty"`
+	ResizeOptions  map[string]interface{} `json:"resize_options,omitempty"`
 }
 
 type APIResponse struct {
 	Success        bool                   `json:"success"`
 	ResultImage    string                 `json:"result_image,omitempty"`
 	MaskImage      string                 `json:"mask_image,omitempty"`
+	MaskRLE        map[string]interface{} `json:"mask_rle,omitempty"`
 	Error          string                 `json:"error,omitempty"`
 	ErrorCode      string                 `json:"error_code,omitempty"`
 	ProcessingTime int64                  `json:"processing_time_ms,omitempty"`
@@ -107,12 +122,13 @@ func LoadConfig() (*Config, error) {
   }
 
   config := &Config{
-		BeamEndpoint: mustGetEnv("BEAM_ENDPOINT_URL"),
-		BeamAPIKey:   mustGetEnv("BEAM_API_KEY"),
-		ServerPort:   port,
-		Environment:  "development",
-		MaxFileSize:  32 << 20, // 32MB
-		Timeout:      180 * time.Second,
+		BeamEndpoint:     mustGetEnv("BEAM_ENDPOINT_URL"),
+		BeamBulkEndpoint: os.Getenv("BEAM_BULK_ENDPOINT_URL"),
+		BeamAPIKey:       mustGetEnv("BEAM_API_KEY"),
+		ServerPort:       port,
+		Environment:      "development",
+		MaxFileSize:      32 << 20, // 32MB
+		Timeout:          180 * time.Second,
 	}
 
 	// Validate configuration
@@ -120,6 +136,10 @@ func LoadConfig() (*Config, error) {
 		return nil, fmt.Errorf("invalid BEAM_ENDPOINT_URL: must start with http or https")
 	}
 
+	if config.BeamBulkEndpoint != "" && !strings.HasPrefix(config.BeamBulkEndpoint, "http") {
+		return nil, fmt.Errorf("invalid BEAM_BULK_ENDPOINT_URL: must start with http or https")
+	}
+
 	if len(config.BeamAPIKey) < 10 {
 		return nil, fmt.Errorf("invalid BEAM_API_KEY: too short")
 	}
@@ -144,13 +164,13 @@ func NewGateway(config *Config, db *database.DB, authService *auth.AuthService)
 }
 
 // Call Beam worker with context and better error handling
-func (g *Gateway) callBeamWorker(ctx context.Context, beamReq BeamRequest) (*BeamResponse, error) {
+func (g *Gateway) callBeamWorker(ctx context.Context, endpoint string, beamReq BeamRequest) (*BeamResponse, error) {
 	reqBody, err := json.Marshal(beamReq)
 	if err != nil {
 		return nil, fmt.Errorf("failed to marshal request: %w", err)
 	}
 
-	req, err := http.NewRequestWithContext(ctx, "POST", g.config.BeamEndpoint, bytes.NewBuffer(reqBody))
+	req, err := http.NewRequestWithContext(ctx, "POST", endpoint, bytes.NewBuffer(reqBody))
 	if err != nil {
 		return nil, fmt.Errorf("failed to create request: %w", err)
 	}
@@ -183,6 +203,25 @@ func (g *Gateway) callBeamWorker(ctx context.Context, beamReq BeamRequest) (*Bea
 	return &beamResp, nil
 }
 
+// Submit to the interactive lane and retry on the bulk lane when the worker's
+// admission control estimates the job is too expensive for interactive use.
+// Without a bulk lane the interactive worker processes expensive jobs itself.
+func (g *Gateway) processWithBeam(ctx context.Context, beamReq BeamRequest) (*BeamResponse, error) {
+	beamReq.SubmittedAt = float64(time.Now().UnixNano()) / 1e9
+	beamReq.BulkLane = g.config.BeamBulkEndpoint != ""
+	beamResp, err := g.callBeamWorker(ctx, g.config.BeamEndpoint, beamReq)
+	if err != nil {
+		return nil, err
+	}
+
+	if !beamResp.Success && beamResp.Code == "ROUTE_TO_BULK" && g.config.BeamBulkEndpoint != "" {
+		beamReq.SubmittedAt = float64(time.Now().UnixNano()) / 1e9
+		return g.callBeamWorker(ctx, g.config.BeamBulkEndpoint, beamReq)
+	}
+
+	return beamResp, nil
+}
+
 // Validate image data format
 func validateImageData(imageData string) error {
 	if imageData == "" {
@@ -195,8 +234,8 @@ func validateImageData(imageData string) error {
 		if len(parts) != 2 {
 			return fmt.Errorf("invalid data URL format")
 		}
-		// Validate MIME type
-		if !strings.Contains(parts[0], "image/") {
+		// Validate MIME type (short videos are accepted as animated input)
+		if !strings.Contains(parts[0], "image/") && !strings.Contains(parts[0], "video/") {
 			return fmt.Errorf("invalid image MIME type")
 		}
 		imageData = parts[1]
@@ -232,6 +271,28 @@ func validateFormat(format string) bool {
 	return false
 }
 
+// Validate animated output format parameter
+func validateAnimatedFormat(format string) bool {
+	validFormats := []string{"gif", "webp", "apng"}
+	for _, v := range validFormats {
+		if format == v {
+			return true
+		}
+	}
+	return false
+}
+
+// Validate output mode parameter
+func validateOutputMode(mode string) bool {
+	validModes := []string{"image", "mask", "mask_bitonal", "mask_rle"}
+	for _, v := range validModes {
+		if mode == v {
+			return true
+		}
+	}
+	return false
+}
+
 // Authentication middleware for protected endpoints
 func (g *Gateway) authMiddleware() gin.HandlerFunc {
 	return func(c *gin.Context) {
@@ -363,21 +424,44 @@ func (g *Gateway) handleRemoveBackground(c *gin.Context) {
 		return
 	}
 
+	if apiReq.AnimatedFormat != "" && !validateAnimatedFormat(apiReq.AnimatedFormat) {
+		c.JSON(http.StatusBadRequest, APIResponse{
+			Success:   false,
+			Error:     "Invalid animated_format parameter",
+			ErrorCode: "INVALID_FORMAT",
+		})
+		return
+	}
+
+	if apiReq.OutputMode != "" && !validateOutputMode(apiReq.OutputMode) {
+		c.JSON(http.StatusBadRequest, APIResponse{
+			Success:   false,
+			Error:     "Invalid output_mode parameter",
+			ErrorCode: "INVALID_OUTPUT_MODE",
+		})
+		return
+	}
+
 	// Build Beam request
 	beamReq := BeamRequest{
-		Image:      apiReq.ImageData,
-		Quality:    apiReq.Quality,
-		Format:     apiReq.Format,
-		ReturnMask: apiReq.ReturnMask,
-		Resize:     apiReq.ResizeOptions,
-		Debug:      g.config.Environment == "development",
+		Image:          apiReq.ImageData,
+		Quality:        apiReq.Quality,
+		Format:         apiReq.Format,
+		AnimatedFormat: apiReq.AnimatedFormat,
+		ReturnMask:     apiReq.ReturnMask,
+		OutputMode:     apiReq.OutputMode,
+		Crop:           apiReq.Crop,
+		Background:     apiReq.Background,
+		Shadow:         apiReq.Shadow,
+		Resize:         apiReq.ResizeOptions,
+		Debug:          g.config.Environment == "development",
 	}
 
 	// Call Beam worker with context
 	ctx, cancel := context.WithTimeout(c.Request.Context(), g.config.Timeout)
 	defer cancel()
 
-	beamResp, err := g.callBeamWorker(ctx, beamReq)
+	beamResp, err := g.processWithBeam(ctx, beamReq)
 	if err != nil {
 		log.Printf("Error calling Beam worker: %v", err)
 
@@ -406,10 +490,12 @@ func (g *Gateway) handleRemoveBackground(c *gin.Context) {
 		if errorCode == "" {
 			errorCode = "PROCESSING_ERROR"
 		}
+		// Metadata carries the lane and cost estimate behind admission-control rejections
 		c.JSON(http.StatusBadRequest, APIResponse{
 			Success:   false,
 			Error:     beamResp.Error,
 			ErrorCode: errorCode,
+			Metadata:  beamResp.Metadata,
 		})
 		g.logUsage(c.Request.Context(), userID.(string), apiKeyID, source, false, beamResp.Error, 0, creditType)
 		return
@@ -422,6 +508,7 @@ func (g *Gateway) handleRemoveBackground(c *gin.Context) {
 		Success:        true,
 		ResultImage:    beamResp.Image,
 		MaskImage:      beamResp.Mask,
+		MaskRLE:        beamResp.MaskRLE,
 		ProcessingTime: processingTime,
 		Metadata:       beamResp.Metadata,
 	}
@@ -506,7 +593,7 @@ func (g *Gateway) handleLegacyUpload(c *gin.Context) {
 	ctx, cancel := context.WithTimeout(c.Request.Context(), g.config.Timeout)
 	defer cancel()
 
-	beamResp, err := g.callBeamWorker(ctx, beamReq)
+	beamResp, err := g.processWithBeam(ctx, beamReq)
 	if err != nil {
 		log.Printf("Error calling Beam worker: %v", err)
 		if ctx.Err() == context.DeadlineExceeded {
@@ -571,14 +658,21 @@ func (g *Gateway) handleAPIInfo(c *gin.Context) {
 			"api_info":          "/api/info",
 		},
 		"supported_formats": []string{"png", "jpg", "jpeg", "webp", "gif"},
+		"animated_formats":  []string{"gif", "webp", "apng"},
 		"quality_presets":   []string{"auto", "quality", "portrait", "product", "speed"},
 		"max_file_size_mb":  g.config.MaxFileSize / (1 << 20),
 		"timeout_seconds":   g.config.Timeout.Seconds(),
 		"features": []string{
 			"static_images",
 			"animated_gifs",
+			"animated_webp_apng",
+			"video_input",
 			"custom_resizing",
 			"mask_output",
+			"mask_only_output",
+			"crop_to_content",
+			"background_replacement",
+			"drop_shadow",
 			"multiple_formats",
 			"input_validation",
 			"timeout_handling",
@@ -900,6 +994,7 @@ go get github.com/gin-contrib/cors
 Environment variables needed:
 BEAM_ENDPOINT_URL=https://your-deployment.app.beam.cloud
 BEAM_API_KEY=your-beam-api-key
+BEAM_BULK_ENDPOINT_URL=https://your-bulk-deployment.app.beam.cloud (optional, for long animated jobs)
 PORT=8080
 ENVIRONMENT=development
 ALLOWED_ORIGINS=https://yourdomain.com,https://anotherdomain.com (for production)